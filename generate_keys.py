@@ -1,14 +1,16 @@
-import pickle
 from pathlib import Path
 
+import yaml
 import streamlit_authenticator as stauth
 
-names = ["Peter Parker", "Rebecca Miller"]
-usernames = ["pparker", "rmiller"]
-passwords = ["abc", "123"]
+# Hash the plain text passwords in psswrds.yaml in place so the app never
+# has to hash them at startup. Already-hashed passwords are left as they are.
+# Key order is preserved, but any comments in the file are lost on rewrite.
+file_path = Path(__file__).parent / "psswrds.yaml"
+with file_path.open() as file:
+    config = yaml.safe_load(file)
 
-hashed_passwords = stauth.Hasher(passwords).generate()
+stauth.Hasher.hash_passwords(config["credentials"])
 
-file_path = Path(__file__).parent / "hashed_pw.pkl"
-with file_path.open("wb") as file:
-    pickle.dump(hashed_passwords, file)
+with file_path.open("w") as file:
+    yaml.dump(config, file, default_flow_style=False, sort_keys=False)
@@ -1,7 +1,12 @@
 import streamlit as st
 import google.generativeai as genai
 from datetime import datetime
-import json
+import orjson
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import diskcache
 #Added for google sheets
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
@@ -10,7 +15,11 @@ import pickle
 from pathlib import Path
 
 import yaml
-from yaml.loader import SafeLoader
+# Prefer the libyaml-backed loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml.loader import SafeLoader
 # Page configuration
 st.set_page_config(
     page_title="Project-Based Curriculum Builder",
@@ -18,17 +27,38 @@ st.set_page_config(
     layout="wide"
 )
 
-with open('./psswrds.yaml') as file:
-    config = yaml.load(file, Loader=SafeLoader)
+# Number of form entries buffered before the sheet is rewritten
+SHEET_WRITE_BATCH = 5
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_sheet(_conn):
+    """Read the entries sheet, cached so widget reruns don't refetch it"""
+    # The connection's own cache is disabled; this function owns the TTL.
+    # Extra options are passed to pandas, so only the used columns are parsed
+    # and they come back as Arrow-backed dtypes that st.dataframe sends as-is.
+    existing_data = _conn.read(worksheet="Sheet1", usecols=list(range(3)), ttl=0, dtype_backend="pyarrow")
+    return existing_data.dropna(how="all")
+
+@st.cache_data(show_spinner=False)
+def load_auth_config(path, mtime):
+    """Load the login config, hashing any plain text passwords once per file version"""
+    # mtime is only part of the cache key, so edits to the file are picked up
+    with open(path) as file:
+        config = yaml.load(file, Loader=SafeLoader)
+
+    # Passwords that are already hashed (see generate_keys.py) are left untouched
+    stauth.Hasher.hash_passwords(config['credentials'])
+    return config
 
-# Pre-hashing all plain text passwords once
-# stauth.Hasher.hash_passwords(config['credentials'])
+AUTH_CONFIG_PATH = Path('./psswrds.yaml')
+config = load_auth_config(AUTH_CONFIG_PATH, AUTH_CONFIG_PATH.stat().st_mtime)
 
 authenticator = stauth.Authenticate(
     config['credentials'],
     config['cookie']['name'],
     config['cookie']['key'],
-    config['cookie']['expiry_days']
+    config['cookie']['expiry_days'],
+    auto_hash=False
 )
 
 
@@ -48,11 +78,14 @@ if st.session_state['authentication_status']:
     conn = st.connection("gsheets", type=GSheetsConnection)
 
     # Fetch existing vendors data
-    existing_data = conn.read(worksheet="Sheet1", usecols=list(range(3)), ttl=5)
-    existing_data = existing_data.dropna(how="all")
+    existing_data = load_sheet(conn)
 
     st.dataframe(existing_data)
 
+    # Entries are buffered here and written to the sheet in one update
+    if "pending_rows" not in st.session_state:
+        st.session_state.pending_rows = []
+
     with st.form(key="entry_form"):
         entry_1 = st.text_input(label="Entry 1")
         entry_2 = st.text_input(label="Entry 2")
@@ -64,24 +97,37 @@ if st.session_state['authentication_status']:
         # If the submit button is pressed
         if submit_button:
         
-                # Create a new row of vendor data
-                entry_form = pd.DataFrame(
-                    [
-                        {
-                            "Entry 1": entry_1,
-                            "Entry 2": entry_2,
-                            "Test Entry": test_entry,
-                        }
-                    ]
+                # Queue a new row of vendor data
+                st.session_state.pending_rows.append(
+                    {
+                        "Entry 1": entry_1,
+                        "Entry 2": entry_2,
+                        "Test Entry": test_entry,
+                    }
                 )
-    
-                # Add the new vendor data to the existing data
-                updated_df = pd.concat([existing_data, entry_form], ignore_index=True)
-    
-                # Update Google Sheets with the new vendor data
-                conn.update(worksheet="Sheet1", data=updated_df)
-    
-                st.success("Details successfully submitted!")
+                st.info("Details queued for saving.")
+
+    pending_rows = st.session_state.pending_rows
+    if pending_rows:
+        st.caption(f"{len(pending_rows)} of {SHEET_WRITE_BATCH} entries waiting to be saved")
+    save_button = st.button("Save Details", disabled=not pending_rows)
+
+    # Flush the buffer once it is full or when the user asks for it
+    if pending_rows and (save_button or len(pending_rows) >= SHEET_WRITE_BATCH):
+        # The cached frame is for display only; conn.update rewrites the whole
+        # sheet, so re-read it first to keep rows added since it was cached
+        load_sheet.clear()
+        latest_data = load_sheet(conn)
+
+        # Add the queued vendor data to the latest data
+        updated_df = pd.concat([latest_data, pd.DataFrame(pending_rows)], ignore_index=True)
+
+        # Update Google Sheets with all queued rows in a single call
+        conn.update(worksheet="Sheet1", data=updated_df)
+        pending_rows.clear()
+        load_sheet.clear()
+
+        st.success("Details successfully submitted!")
 
 
 elif st.session_state['authentication_status'] is False:
@@ -94,9 +140,6 @@ elif st.session_state['authentication_status'] is None:
 
 
 
-# Initialize Gemini client
-genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-
 # Initialize session state
 if "generated_lessons" not in st.session_state:
     st.session_state.generated_lessons = []
@@ -106,25 +149,162 @@ if "current_view" not in st.session_state:
     st.session_state.current_view = "edit"  # Can be 'edit' or 'view'
 
 # Constants
-GRADE_LEVELS = ["K-2", "3-5", "6-8", "9-12"]
+GRADE_LEVELS = ("K-2", "3-5", "6-8", "9-12")
 
+# Option lists are tuples so their hashes stay cheap across reruns
 SUBJECT_AREAS = {
-    "Science": ["Biology", "Chemistry", "Physics", "Environmental Science", "Earth Science"],
-    "Technology": ["Computer Science", "Digital Literacy", "Robotics", "Programming", "Data Science"],
-    "Engineering": ["Mechanical", "Electrical", "Civil", "Aerospace", "Software"],
-    "Mathematics": ["Algebra", "Geometry", "Statistics", "Calculus", "Number Theory"],
-    "Social Studies": ["History", "Geography", "Civics", "Economics", "Anthropology"],
-    "Language Arts": ["Literature", "Writing", "Reading", "Grammar", "Poetry"],
-    "Art": ["Visual Arts", "Music", "Drama", "Dance", "Photography"],
-    "Physical Education": ["Sports", "Health", "Fitness", "Wellness", "Nutrition"],
-    "Foreign Languages": ["Spanish", "French", "German", "Chinese", "Japanese"],
-    "Other": ["Custom Topic"]
+    "Science": ("Biology", "Chemistry", "Physics", "Environmental Science", "Earth Science"),
+    "Technology": ("Computer Science", "Digital Literacy", "Robotics", "Programming", "Data Science"),
+    "Engineering": ("Mechanical", "Electrical", "Civil", "Aerospace", "Software"),
+    "Mathematics": ("Algebra", "Geometry", "Statistics", "Calculus", "Number Theory"),
+    "Social Studies": ("History", "Geography", "Civics", "Economics", "Anthropology"),
+    "Language Arts": ("Literature", "Writing", "Reading", "Grammar", "Poetry"),
+    "Art": ("Visual Arts", "Music", "Drama", "Dance", "Photography"),
+    "Physical Education": ("Sports", "Health", "Fitness", "Wellness", "Nutrition"),
+    "Foreign Languages": ("Spanish", "French", "German", "Chinese", "Japanese"),
+    "Other": ("Custom Topic",)
 }
 
-DELIVERY_OPTIONS = ["Asynchronous", "Multi-Day Project", "One-Off Challenge (1-2 hours)"]
+DELIVERY_OPTIONS = ("Asynchronous", "Multi-Day Project", "One-Off Challenge (1-2 hours)")
 
-def generate_lesson_plan(grade_level, subject_area, specific_topic, delivery_timeline, objectives, materials_budget):
-    """Generate a lesson plan using the Gemini API"""
+# Styles for the lesson plan view cards
+LESSON_CSS = """
+    <style>
+    .metadata-card {
+        background-color: #f8f9fa;
+        padding: 20px;
+        border-radius: 10px;
+        margin-bottom: 20px;
+        color: #1f2937;
+    }
+    .section-card {
+        background-color: white;
+        padding: 20px;
+        border-radius: 10px;
+        margin-bottom: 15px;
+        border: 1px solid #e9ecef;
+        color: #1f2937;
+    }
+    .section-title {
+        color: #1f2937;
+        font-size: 1.2em;
+        font-weight: bold;
+        margin-bottom: 10px;
+    }
+    .section-content {
+        color: #374151;
+        line-height: 1.6;
+    }
+    .metadata-card p {
+        color: #374151;
+        margin: 8px 0;
+    }
+    .metadata-card h3 {
+        color: #1f2937;
+        margin-bottom: 15px;
+    }
+    </style>
+"""
+
+# Lesson plan section headers requested in the prompt
+_SECTION_NAMES = frozenset({
+    "Overview", "Learning Objectives", "Required Materials", "Preparation Steps", "Lesson Procedure",
+    "Extensions and Modifications", "Assessment Criteria", "Safety Considerations", "Take-Home Connection"
+})
+
+MODEL_NAME = "gemini-1.5-pro-002"
+
+@st.cache_resource
+def get_model(name=MODEL_NAME):
+    """Configure the Gemini client and build the model once per process"""
+    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
+    return genai.GenerativeModel(name)
+
+# Client-side pacing for Gemini; the quota is shared by every Streamlit worker process
+GEMINI_RPM = 60
+GEMINI_TPM = 1_000_000
+STREAMLIT_WORKERS = 1
+
+class TokenBucket:
+    """Token bucket limiting both requests and prompt tokens per minute"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.request_capacity = requests_per_minute
+        self.token_capacity = tokens_per_minute
+        self.request_tokens = requests_per_minute
+        self.token_tokens = tokens_per_minute
+        self.last_update = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Top up both buckets for the time elapsed since the last update"""
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.request_tokens = min(self.request_capacity, self.request_tokens + elapsed * self.request_capacity / 60)
+        self.token_tokens = min(self.token_capacity, self.token_tokens + elapsed * self.token_capacity / 60)
+        self.last_update = now
+
+    def acquire(self, estimated_tokens: int):
+        """Block until one request of estimated_tokens fits within both limits"""
+        estimated_tokens = min(estimated_tokens, self.token_capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.request_tokens >= 1 and self.token_tokens >= estimated_tokens:
+                    self.request_tokens -= 1
+                    self.token_tokens -= estimated_tokens
+                    return
+                wait = max(
+                    (1 - self.request_tokens) * 60 / self.request_capacity,
+                    (estimated_tokens - self.token_tokens) * 60 / self.token_capacity
+                )
+            time.sleep(wait)
+
+@st.cache_resource
+def get_rate_limiter():
+    """Share one token bucket between all sessions in this process"""
+    return TokenBucket(GEMINI_RPM / STREAMLIT_WORKERS, GEMINI_TPM / STREAMLIT_WORKERS)
+
+# Full lesson plans are cached on disk so repeat prompts skip the API
+LLM_CACHE_DIR = "./.llm_cache"
+LLM_CACHE_TTL = 7 * 24 * 3600
+
+@st.cache_resource
+def get_llm_cache():
+    """Open the on-disk response cache once per process"""
+    return diskcache.Cache(LLM_CACHE_DIR)
+
+def _cache_key(prompt: str, model_name: str) -> str:
+    """Build the response cache key for a prompt/model pair"""
+    return hashlib.sha256((prompt + model_name).encode()).hexdigest()
+
+def _generate(model, limiter: TokenBucket, prompt: str) -> str:
+    """Pace and send one request; touches no Streamlit APIs so worker threads can run it"""
+    # Roughly four characters per token is close enough for pacing
+    limiter.acquire(len(prompt) // 4)
+    return model.generate_content(prompt).text
+
+def _call_gemini(prompt: str, model_name: str) -> str:
+    """Return a fresh Gemini response, bypassing the response cache"""
+    return _generate(get_model(model_name), get_rate_limiter(), prompt)
+
+def _stream_gemini(prompt: str, model_name: str, placeholder) -> str:
+    """Stream a Gemini response into a placeholder, storing the final text on disk"""
+    cache = get_llm_cache()
+    key = _cache_key(prompt, model_name)
+    text = cache.get(key)
+    if text is None:
+        chunks = []
+        get_rate_limiter().acquire(len(prompt) // 4)
+        for chunk in get_model(model_name).generate_content(prompt, stream=True):
+            chunks.append(chunk.text)
+            placeholder.markdown("".join(chunks))
+        text = "".join(chunks)
+        cache.set(key, text, expire=LLM_CACHE_TTL)
+    return text
+
+def generate_lesson_plan(grade_level, subject_area, specific_topic, delivery_timeline, objectives, materials_budget, placeholder):
+    """Generate a lesson plan using the Gemini API, streaming it into placeholder"""
     prompt = f"""
     Create a detailed project-based lesson plan with the following parameters:
     - Grade Level: {grade_level}
@@ -170,16 +350,14 @@ def generate_lesson_plan(grade_level, subject_area, specific_topic, delivery_tim
     """
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-pro-002')
-        response = model.generate_content(prompt)
-        return response.text
+        return _stream_gemini(prompt, MODEL_NAME, placeholder)
     except Exception as e:
         st.error(f"Error generating lesson plan: {e}")
         return None
 
-def regenerate_section(section_name: str, context: dict) -> str:
-    """Regenerate a specific section of the lesson plan"""
-    prompt = f"""
+def _section_prompt(section_name: str, context: dict) -> str:
+    """Build the prompt used to regenerate a single section"""
+    return f"""
     For a project-based lesson plan with:
     - Grade Level: {context['grade_level']}
     - Subject Area: {context['subject_area']}
@@ -189,17 +367,38 @@ def regenerate_section(section_name: str, context: dict) -> str:
     Please regenerate only the {section_name} section.
     Make it detailed, grade-appropriate, and specific to the topic.
     """
-    
+
+def regenerate_section(section_name: str, context: dict) -> str:
+    """Regenerate a specific section of the lesson plan"""
     try:
-        model = genai.GenerativeModel('gemini-1.5-pro-002')
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return _call_gemini(_section_prompt(section_name, context), MODEL_NAME).strip()
     except Exception as e:
         st.error(f"Error regenerating section: {e}")
         return None
 
-def parse_lesson_sections(content):
-    """Parse lesson content into sections"""
+def regenerate_sections(section_names: list, context: dict) -> dict:
+    """Regenerate several sections concurrently, skipping any that fail"""
+    # Resolve cached resources here; worker threads have no script run context
+    model = get_model(MODEL_NAME)
+    limiter = get_rate_limiter()
+    # Gemini calls are I/O bound, so threads overlap the network waits
+    with ThreadPoolExecutor(max_workers=min(len(section_names), 8)) as executor:
+        futures = {
+            name: executor.submit(_generate, model, limiter, _section_prompt(name, context))
+            for name in section_names
+        }
+
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result().strip()
+        except Exception as e:
+            st.error(f"Error regenerating {name}: {e}")
+    return results
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def parse_lesson_sections(content: str) -> dict:
+    """Parse lesson content into sections, memoised on the content string"""
     sections = {}
     current_section = None
     current_content = []
@@ -208,10 +407,10 @@ def parse_lesson_sections(content):
         return sections
         
     for line in content.split('\n'):
-        if any(section in line for section in ["Overview:", "Learning Objectives:", "Required Materials:", 
-                                             "Preparation Steps:", "Lesson Procedure:", 
-                                             "Extensions and Modifications:", "Assessment Criteria:", 
-                                             "Safety Considerations:", "Take-Home Connection:"]):
+        # Headers may be wrapped in markdown or list markers, e.g. "**Overview:**",
+        # "## Overview:", "1. Required Materials:" or "- Safety Considerations:"
+        head, sep, _ = line.partition(':')
+        if sep and head.strip(' #*').lstrip('-+•0123456789.) ').strip(' #*') in _SECTION_NAMES:
             if current_section:
                 sections[current_section] = '\n'.join(current_content).strip()
             current_section = line.strip()
@@ -225,6 +424,15 @@ def parse_lesson_sections(content):
     
     return sections
 
+def join_sections(sections: dict) -> str:
+    """Rebuild lesson content from its parsed sections"""
+    return '\n'.join(part for s, c in sections.items() for part in (s, c.strip(), ""))
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def lesson_to_json(lesson: dict) -> bytes:
+    """Serialize a lesson for download, only redoing the work when it changes"""
+    return orjson.dumps(lesson, option=orjson.OPT_INDENT_2)
+
 def display_lesson_plan_view(lesson_data):
     """Display the lesson plan in view mode"""
     if not lesson_data:
@@ -233,44 +441,7 @@ def display_lesson_plan_view(lesson_data):
         
     st.header("Lesson Plan View")
     
-    # Display metadata in a clean card format
-    st.markdown("""
-    <style>
-    .metadata-card {
-        background-color: #f8f9fa;
-        padding: 20px;
-        border-radius: 10px;
-        margin-bottom: 20px;
-        color: #1f2937;
-    }
-    .section-card {
-        background-color: white;
-        padding: 20px;
-        border-radius: 10px;
-        margin-bottom: 15px;
-        border: 1px solid #e9ecef;
-        color: #1f2937;
-    }
-    .section-title {
-        color: #1f2937;
-        font-size: 1.2em;
-        font-weight: bold;
-        margin-bottom: 10px;
-    }
-    .section-content {
-        color: #374151;
-        line-height: 1.6;
-    }
-    .metadata-card p {
-        color: #374151;
-        margin: 8px 0;
-    }
-    .metadata-card h3 {
-        color: #1f2937;
-        margin-bottom: 15px;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    # Card styles come from LESSON_CSS, emitted once per run in main()
     
     # Metadata section
     st.markdown(f"""
@@ -294,6 +465,33 @@ def display_lesson_plan_view(lesson_data):
         </div>
         """, unsafe_allow_html=True)
 
+def on_regenerate_section(lesson_data, sections, section, context):
+    """Button callback that regenerates one section before the app reruns"""
+    with st.spinner(f"Regenerating {section}..."):
+        new_content = regenerate_section(section, context)
+    if new_content:
+        st.session_state.current_lesson = {**lesson_data, 'content': join_sections({**sections, section: new_content})}
+        # Callbacks run before the widgets, so the text area can be refreshed here
+        st.session_state[f"edit_{section}"] = new_content
+        st.session_state.pop(f"draft_{section}", None)
+        st.success(f"{section} regenerated!")
+
+def on_regenerate_sections(lesson_data, sections, context):
+    """Button callback that regenerates the sections picked in the multiselect"""
+    stale_sections = st.session_state.stale_sections
+    with st.spinner(f"Regenerating {len(stale_sections)} sections..."):
+        new_sections = regenerate_sections(stale_sections, context)
+    if new_sections:
+        st.session_state.current_lesson = {**lesson_data, 'content': join_sections({**sections, **new_sections})}
+        for section, new_content in new_sections.items():
+            st.session_state[f"edit_{section}"] = new_content
+            st.session_state.pop(f"draft_{section}", None)
+
+def keep_draft(section):
+    """Text area callback that copies an unsaved edit into a non-widget key"""
+    # Widget keys are dropped whenever the text areas aren't rendered (View mode)
+    st.session_state[f"draft_{section}"] = st.session_state[f"edit_{section}"]
+
 def display_lesson_plan_edit(lesson_data):
     """Display the lesson plan in edit mode with editable sections"""
     if not lesson_data:
@@ -312,49 +510,76 @@ def display_lesson_plan_edit(lesson_data):
 
     # Split content into sections and display with edit capabilities
     sections = parse_lesson_sections(lesson_data.get('content', ''))
+    context = {
+        'grade_level': lesson_data.get('grade_level'),
+        'subject_area': lesson_data.get('subject_area'),
+        'specific_topic': lesson_data.get('specific_topic'),
+        'delivery_timeline': lesson_data.get('delivery_timeline')
+    }
     
     for section, content in sections.items():
         with st.expander(f"📝 {section}", expanded=True):
             col1, col2 = st.columns([4, 1])
             
             with col1:
-                edited_content = st.text_area(
+                # Unsaved edits are kept as drafts until they are saved below
+                if f"edit_{section}" not in st.session_state:
+                    st.session_state[f"edit_{section}"] = st.session_state.get(f"draft_{section}", content)
+                st.text_area(
                     f"Edit {section}",
-                    value=content,
                     key=f"edit_{section}",
-                    height=200
+                    height=200,
+                    on_change=keep_draft,
+                    args=(section,)
                 )
-                
-                if edited_content != content:
-                    sections[section] = edited_content
-                    # Update the full content
-                    updated_content = []
-                    for s, c in sections.items():
-                        updated_content.extend([s, c.strip(), ""])
-                    lesson_data['content'] = '\n'.join(updated_content)
             
             with col2:
-                if st.button("🔄 Regenerate", key=f"regen_{section}"):
-                    with st.spinner(f"Regenerating {section}..."):
-                        context = {
-                            'grade_level': lesson_data.get('grade_level'),
-                            'subject_area': lesson_data.get('subject_area'),
-                            'specific_topic': lesson_data.get('specific_topic'),
-                            'delivery_timeline': lesson_data.get('delivery_timeline')
-                        }
-                        new_content = regenerate_section(section, context)
-                        if new_content:
-                            sections[section] = new_content
-                            updated_content = []
-                            for s, c in sections.items():
-                                updated_content.extend([s, c.strip(), ""])
-                            lesson_data['content'] = '\n'.join(updated_content)
-                            st.success(f"{section} regenerated!")
-                            st.experimental_rerun()
+                st.button(
+                    "🔄 Regenerate",
+                    key=f"regen_{section}",
+                    on_click=on_regenerate_section,
+                    args=(lesson_data, sections, section, context)
+                )
+
+    # Regenerate several sections at once instead of one click at a time
+    stale_sections = st.multiselect("Sections to regenerate", list(sections.keys()), key="stale_sections")
+    st.button(
+        "🔄 Regenerate Selected",
+        disabled=not stale_sections,
+        on_click=on_regenerate_sections,
+        args=(lesson_data, sections, context)
+    )
+
+    if st.button("💾 Save Changes", type="primary"):
+        # Rebuild the full content once from the edited sections
+        for section in sections:
+            sections[section] = st.session_state[f"edit_{section}"]
+            st.session_state.pop(f"draft_{section}", None)
+        # Lessons are shared with the history list, so replace rather than mutate
+        st.session_state.current_lesson = {**lesson_data, 'content': join_sections(sections)}
+        st.success("Changes saved!")
+
+def has_unsaved_edits() -> bool:
+    """Whether any section has a draft that hasn't been saved yet"""
+    return any(key.startswith("draft_") for key in st.session_state)
+
+def clear_section_edits():
+    """Drop the edit widget state and drafts so the next lesson's sections start fresh"""
+    for key in [key for key in st.session_state if key.startswith(("edit_", "draft_"))]:
+        del st.session_state[key]
+
+def select_lesson(lesson):
+    """History button callback that makes a past lesson the current one"""
+    clear_section_edits()
+    st.session_state.current_lesson = lesson
 
 def main():
+    st.markdown(LESSON_CSS, unsafe_allow_html=True)
     st.title("📝 Project-Based Curriculum Builder")
     st.write("Generate customized project-based lesson plans aligned with educational standards")
+
+    # Generated text is streamed here while the lesson plan is being written
+    preview = st.empty()
     
     # Sidebar inputs
     with st.sidebar:
@@ -365,7 +590,7 @@ def main():
         st.session_state.current_view = view_mode.lower()
         
         grade_level = st.selectbox("Grade Level", GRADE_LEVELS)
-        subject_area = st.selectbox("Subject Area", list(SUBJECT_AREAS.keys()))
+        subject_area = st.selectbox("Subject Area", tuple(SUBJECT_AREAS))
         specific_topic = st.selectbox("Specific Topic", SUBJECT_AREAS[subject_area])
         
         # Custom topic input if 'Other' is selected
@@ -399,12 +624,16 @@ def main():
                         specific_topic,
                         delivery_timeline,
                         objectives,
-                        materials_budget
+                        materials_budget,
+                        preview
                     )
+                    preview.empty()
                     
                     if lesson_plan:
+                        created_at = datetime.now()
                         new_lesson = {
-                            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            "timestamp": created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                            "file_timestamp": created_at.strftime("%Y%m%d_%H%M%S"),
                             "grade_level": grade_level,
                             "subject_area": subject_area,
                             "specific_topic": specific_topic,
@@ -413,8 +642,9 @@ def main():
                             "materials_budget": materials_budget,
                             "content": lesson_plan
                         }
+                        clear_section_edits()
                         st.session_state.current_lesson = new_lesson
-                        st.session_state.generated_lessons.append(new_lesson.copy())
+                        st.session_state.generated_lessons.append(new_lesson)
                         st.success("Lesson plan generated successfully!")
 
     # Main content area
@@ -423,14 +653,16 @@ def main():
         if st.session_state.current_view == "edit":
             display_lesson_plan_edit(st.session_state.current_lesson)
         else:
+            if has_unsaved_edits():
+                st.warning("You have unsaved edits. Switch back to Edit and save them to see them here.")
             display_lesson_plan_view(st.session_state.current_lesson)
         
     
 # Download button
         st.download_button(
             label="Download Lesson Plan",
-            data=json.dumps(st.session_state.current_lesson, indent=2),
-            file_name=f"lesson_plan_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            data=lesson_to_json(st.session_state.current_lesson),
+            file_name=f"lesson_plan_{st.session_state.current_lesson['file_timestamp']}.json",
             mime="application/json"
         )
         
@@ -438,12 +670,12 @@ def main():
         if st.session_state.generated_lessons:
             st.sidebar.header("Lesson History")
             for idx, lesson in enumerate(reversed(st.session_state.generated_lessons)):
-                if st.sidebar.button(
+                st.sidebar.button(
                     f"{lesson['subject_area']} - {lesson['specific_topic']} ({lesson['timestamp']})",
-                    key=f"history_{idx}"
-                ):
-                    st.session_state.current_lesson = lesson.copy()
-                    st.experimental_rerun()
+                    key=f"history_{idx}",
+                    on_click=select_lesson,
+                    args=(lesson,)
+                )
 
 if __name__ == "__main__":
     main()
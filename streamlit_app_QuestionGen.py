@@ -3,11 +3,63 @@ import google.generativeai as genai
 import json
 import re
 from bs4 import BeautifulSoup
-from typing import Optional
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+# Use the C-based lxml tree builder when it is installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
 
 # Streamlit configuration
 st.set_page_config(page_title="AI Teacher Tools", layout="wide")
 
+# App-wide styles, including the Notion lesson plan rendering
+_APP_CSS = """
+    <style>
+    .stButton>button {
+        width: 100%;
+    }
+    .stMetric {
+        background-color: #f0f2f6;
+        padding: 10px;
+        border-radius: 5px;
+    }
+    .notion-title {
+        font-size: 2.5em;
+        font-weight: 700;
+        margin-bottom: 0.5em;
+    }
+    .notion-metadata {
+        display: flex;
+        gap: 1em;
+        margin-bottom: 2em;
+    }
+    .notion-tag {
+        background: #f0f0f0;
+        padding: 4px 8px;
+        border-radius: 4px;
+        font-size: 0.9em;
+    }
+    .notion-section {
+        margin: 2em 0;
+    }
+    .notion-content {
+        margin-left: 1.5em;
+    }
+    .question-insert-area {
+        border-left: 3px solid #f63366;
+        padding-left: 1em;
+        margin: 1em 0;
+        background-color: #f7f7f7;
+    }
+    </style>
+"""
+
+st.markdown(_APP_CSS, unsafe_allow_html=True)
+
 # Initialize Gemini client
 genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
 
@@ -22,20 +74,106 @@ if "current_score" not in st.session_state:
     st.session_state.current_score = 0
 if "total_questions" not in st.session_state:
     st.session_state.total_questions = 0
-if "answered_questions" not in st.session_state:
-    st.session_state.answered_questions = set()
+if "answered_mask" not in st.session_state:
+    st.session_state.answered_mask = 0  # Bit i is set once question i is answered
+if "correct_mask" not in st.session_state:
+    st.session_state.correct_mask = 0  # Bit i is set once question i earned its point
+if "submitted_answers" not in st.session_state:
+    st.session_state.submitted_answers = {}  # Locked-in choice per question index
 if "lesson_plan_content" not in st.session_state:
     st.session_state.lesson_plan_content = None
 if "section_questions" not in st.session_state:
     st.session_state.section_questions = {}
 
-def parse_notion_html(html_content: str) -> Optional[dict]:
-    """Parse Notion-exported HTML into structured content"""
+# Shared sampling settings for question generation
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+}
+
+# Output tokens allowed per requested question, plus a little slack per request
+_PER_Q_TOKEN_BUDGET = 256
+
+def output_budget(num_questions: int) -> dict:
+    """Per-request generation_config override sized to the number of questions"""
+    return {"max_output_tokens": min(8192, _PER_Q_TOKEN_BUDGET * num_questions + 128)}
+
+def generation_config_for(num_questions: int) -> tuple:
+    """Hashable sampling settings with an output budget sized to the request"""
+    return tuple(sorted({**GENERATION_CONFIG, **output_budget(num_questions)}.items()))
+
+FORMAT_RULES = """Format requirements:
+- For Multiple Choice: Include options a), b), c), d). Mark correct answer with *.
+- For True/False: Clearly state Answer: True/False
+- For Short Answer: Include a brief acceptable answer
+- For Open Ended: Include a sample response"""
+
+def question_request(num_questions: int, question_type: str, topic: str) -> str:
+    """Word the question request the same way for every prompt"""
+    noun = "question" if num_questions == 1 else "questions"
+    return f"Generate {num_questions} {question_type} {noun} about: {topic}"
+
+def lesson_plan_prompt(lesson_plan: str, num_questions: int, question_type: str, topic: str) -> str:
+    """Build a prompt with the static lesson plan first and the per-request task last"""
+    if num_questions == 1:
+        closing = "Make the question clear and educational"
+    else:
+        # Numbering is what parse_generated_questions splits a batch on
+        closing = "Number each question. Make questions clear and educational"
+    # Gemini's implicit cache only applies to a byte-identical prompt prefix,
+    # so nothing that varies between requests may come before the lesson plan
+    return (
+        "You are a teaching assistant creating educational questions. "
+        "Base them on this lesson plan:\n\n"
+        f"{lesson_plan}\n\n---\nTask: {question_request(num_questions, question_type, topic)}\n\n"
+        f"{FORMAT_RULES}\n\n{closing}, using specific content from the lesson plan."
+    )
+
+@st.cache_resource
+def get_model(model_name: str):
+    """Build each model once with the shared sampling settings"""
+    return genai.GenerativeModel(
+        model_name=model_name,
+        generation_config=GENERATION_CONFIG,
+    )
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_generate(model_name: str, cfg_items: tuple, prompt: str) -> str:
+    """Generate text with Gemini, reusing the response for identical requests"""
+    # The sized config stays in the cache key but only overrides this one request
+    return get_model(model_name).generate_content(prompt, generation_config=dict(cfg_items)).text
+
+# Tags such as "7th", "3rd Grade" or "Kindergarten" are grade levels; others are subjects
+_GRADE_RE = re.compile(r'\b(?:\d+(?:st|nd|rd|th)|grades?|kindergarten)\b', re.IGNORECASE)
+
+# Parsed section content nodes. Rendering dispatches on the `kind` class
+# attribute rather than isinstance, because every rerun redefines these
+# classes while parsed plans kept in session_state hold the old ones.
+class TextNode(NamedTuple):
+    content: str
+    kind = 'text'
+
+class ListNode(NamedTuple):
+    items: tuple
+    ordered: bool
+    kind = 'list'
+
+class ImageNode(NamedTuple):
+    src: str
+    alt: str
+    kind = 'image'
+
+_HEADER_TAGS = frozenset({'h1', 'h2', 'h3'})
+
+@st.cache_data(max_entries=8, ttl=3600, show_spinner=False)
+def parse_notion_html(html_content: bytes) -> Optional[dict]:
+    """Parse Notion-exported HTML into structured content, memoised on the HTML"""
     if not html_content:
         return None
         
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = BeautifulSoup(html_content, HTML_PARSER, from_encoding='utf-8')
         
         # Extract title and metadata
         title = soup.find('h1', {'class': 'page-title'})
@@ -46,18 +184,18 @@ def parse_notion_html(html_content: str) -> Optional[dict]:
         subjects = []
         for select in soup.find_all(class_='select-value-color-red'):
             text = select.text.strip()
-            if any(grade in text.lower() for grade in ['th', 'grade']):
-                grade_levels.append(text)
-            else:
-                subjects.append(text)
+            (grade_levels if _GRADE_RE.search(text) else subjects).append(text)
                 
         # Parse content sections
         sections = []
         current_section = None
         
-        for elem in soup.select('.page-body > *'):
+        page_body = soup.find(class_='page-body')
+        body_elements = page_body.find_all(recursive=False) if page_body else []
+        
+        for elem in body_elements:
             # Handle headers
-            if elem.name in ['h1', 'h2', 'h3']:
+            if elem.name in _HEADER_TAGS:
                 if current_section:
                     sections.append(current_section)
                 current_section = {
@@ -68,25 +206,16 @@ def parse_notion_html(html_content: str) -> Optional[dict]:
             # Handle content
             elif current_section is not None:
                 if elem.name == 'p':
-                    current_section['content'].append({
-                        'type': 'text',
-                        'content': elem.text.strip()
-                    })
+                    current_section['content'].append(TextNode(elem.text.strip()))
                 elif elem.name in ['ul', 'ol']:
-                    items = [li.text.strip() for li in elem.find_all('li')]
-                    current_section['content'].append({
-                        'type': 'list',
-                        'items': items,
-                        'ordered': elem.name == 'ol'
-                    })
+                    # Only direct items; walking the whole subtree also
+                    # repeats the text of any nested list
+                    items = tuple(li.text.strip() for li in elem.find_all('li', recursive=False))
+                    current_section['content'].append(ListNode(items, elem.name == 'ol'))
                 elif elem.name == 'figure':
                     img = elem.find('img')
                     if img and img.get('src'):
-                        current_section['content'].append({
-                            'type': 'image',
-                            'src': img['src'],
-                            'alt': img.get('alt', '')
-                        })
+                        current_section['content'].append(ImageNode(img['src'], img.get('alt', '')))
         
         if current_section:
             sections.append(current_section)
@@ -106,40 +235,6 @@ def render_lesson_plan(content: dict):
     """Render lesson plan content using Streamlit components with question insertion capabilities"""
     if not content:
         return
-        
-    # Custom CSS
-    st.markdown("""
-        <style>
-        .notion-title {
-            font-size: 2.5em;
-            font-weight: 700;
-            margin-bottom: 0.5em;
-        }
-        .notion-metadata {
-            display: flex;
-            gap: 1em;
-            margin-bottom: 2em;
-        }
-        .notion-tag {
-            background: #f0f0f0;
-            padding: 4px 8px;
-            border-radius: 4px;
-            font-size: 0.9em;
-        }
-        .notion-section {
-            margin: 2em 0;
-        }
-        .notion-content {
-            margin-left: 1.5em;
-        }
-        .question-insert-area {
-            border-left: 3px solid #f63366;
-            padding-left: 1em;
-            margin: 1em 0;
-            background-color: #f7f7f7;
-        }
-        </style>
-    """, unsafe_allow_html=True)
     
     # Title and metadata
     st.markdown(f'<h1 class="notion-title">{content["title"]}</h1>', unsafe_allow_html=True)
@@ -155,108 +250,98 @@ def render_lesson_plan(content: dict):
         for subject in content['subjects']:
             st.markdown(f'<span class="notion-tag">{subject}</span>', unsafe_allow_html=True)
     
-    # Render sections
+    # Render sections; each one reruns on its own when its widgets change
     for section_idx, section in enumerate(content['sections']):
-        with st.container():
-            # Section header
-            if section['level'] == 2:
-                st.markdown(f"## {section['title']}")
-            elif section['level'] == 3:
-                st.markdown(f"### {section['title']}")
-            else:
-                st.markdown(f"#### {section['title']}")
+        _render_section(section_idx, section)
+
+@st.fragment
+def _render_section(section_idx: int, section: dict):
+    """Render one lesson plan section along with its inserted questions"""
+    with st.container():
+        # Section header
+        if section['level'] == 2:
+            st.markdown(f"## {section['title']}")
+        elif section['level'] == 3:
+            st.markdown(f"### {section['title']}")
+        else:
+            st.markdown(f"#### {section['title']}")
+        
+        # Add question insertion area before content
+        with st.expander("➕ Add Question/Prompt Here", expanded=False):
+            section_key = f"section_{section_idx}"
             
-            # Add question insertion area before content
-            with st.expander("➕ Add Question/Prompt Here", expanded=False):
-                section_key = f"section_{section_idx}"
-                
-                # Question type selection
-                question_type = st.selectbox(
-                    "Question Type",
-                    ["Multiple Choice", "True/False", "Short Answer", "Open Ended"],
-                    key=f"type_{section_key}"
-                )
-                
-                # Question prompt input
-                prompt = st.text_area(
-                    "Enter your question or prompt",
-                    key=f"prompt_{section_key}"
-                )
-                
-                # Generate button
-                if st.button("Generate Question", key=f"gen_{section_key}"):
-                    if prompt:
-                        try:
-                            generated_question = generate_single_question(
-                                question_type,
-                                prompt,
-                                section['title']
-                            )
-                            if section_key not in st.session_state.section_questions:
-                                st.session_state.section_questions[section_key] = []
-                            st.session_state.section_questions[section_key].append({
-                                'question': generated_question,
-                                'type': question_type
-                            })
-                            st.success("Question generated successfully!")
-                        except Exception as e:
-                            st.error(f"Error generating question: {e}")
-                    else:
-                        st.warning("Please enter a prompt before generating.")
+            # Question type selection
+            question_type = st.selectbox(
+                "Question Type",
+                ["Multiple Choice", "True/False", "Short Answer", "Open Ended"],
+                key=f"type_{section_key}"
+            )
             
-            # Display existing questions for this section
-            if section_key in st.session_state.section_questions:
-                for q_idx, question_data in enumerate(st.session_state.section_questions[section_key]):
-                    with st.container():
-                        st.markdown("---")
-                        display_question(
-                            question_data['question'],
-                            question_data['type'],
-                            f"{section_key}_{q_idx}"
-                        )
+            # Question prompt input
+            prompt = st.text_area(
+                "Enter your question or prompt",
+                key=f"prompt_{section_key}"
+            )
             
-            # Section content
-            with st.container():
-                for item in section['content']:
-                    if item['type'] == 'text':
-                        st.markdown(item['content'])
-                    elif item['type'] == 'list':
-                        if item['ordered']:
-                            for i, li in enumerate(item['items'], 1):
-                                st.markdown(f"{i}. {li}")
-                        else:
-                            for li in item['items']:
-                                st.markdown(f"* {li}")
-                    elif item['type'] == 'image':
-                        st.image(item['src'], caption=item['alt'])
+            # Generate button
+            if st.button("Generate Question", key=f"gen_{section_key}"):
+                if prompt:
+                    try:
+                        generated_question = generate_single_question(
+                            question_type,
+                            prompt,
+                            section['title']
+                        )
+                        if section_key not in st.session_state.section_questions:
+                            st.session_state.section_questions[section_key] = []
+                        st.session_state.section_questions[section_key].append({
+                            'question': generated_question,
+                            'type': question_type
+                        })
+                        st.success("Question generated successfully!")
+                    except Exception as e:
+                        st.error(f"Error generating question: {e}")
+                else:
+                    st.warning("Please enter a prompt before generating.")
+        
+        # Display existing questions for this section
+        if section_key in st.session_state.section_questions:
+            for q_idx, question_data in enumerate(st.session_state.section_questions[section_key]):
+                with st.container():
+                    st.markdown("---")
+                    display_question(
+                        question_data['question'],
+                        question_data['type'],
+                        f"{section_key}_{q_idx}"
+                    )
+        
+        # Section content
+        with st.container():
+            for item in section['content']:
+                if item.kind == 'text':
+                    st.markdown(item.content)
+                elif item.kind == 'list':
+                    # One markdown element per list instead of one per item
+                    if item.ordered:
+                        st.markdown('\n'.join(f"{i}. {li}" for i, li in enumerate(item.items, 1)))
+                    else:
+                        st.markdown('\n'.join(f"* {li}" for li in item.items))
+                elif item.kind == 'image':
+                    st.image(item.src, caption=item.alt)
 
 def generate_single_question(question_type: str, prompt: str, section_title: str) -> dict:
     """Generate a single question using the AI model"""
-    prompt_template = f"""
-    Generate 1 {question_type} question about: {prompt}
-    This question is for the section: {section_title}
-    
-    Format requirements:
-    - For Multiple Choice: Include options a), b), c), d). Mark correct answer with *.
-    - For True/False: Clearly state Answer: True/False
-    - For Short Answer: Include a brief acceptable answer
-    - For Open Ended: Include a sample response
-    """
-    
-    generation_config = {
-        "temperature": 0.7,
-        "top_p": 0.95,
-        "top_k": 40,
-        "max_output_tokens": 8192,
-    }
-    
-    model = genai.GenerativeModel(
-        model_name="gemini-1.5-pro-002",
-        generation_config=generation_config,
+    prompt_template = (
+        f"{question_request(1, question_type, prompt)}\n"
+        f"This question is for the section: {section_title}\n\n{FORMAT_RULES}"
     )
     
-    response = model.generate_content(prompt_template)
-    questions = parse_generated_questions(response.text, question_type)
+    response_text = _cached_generate(
+        "gemini-1.5-pro-002",
+        generation_config_for(1),
+        prompt_template
+    )
+    questions = parse_generated_questions(response_text, question_type)
     return questions[0] if questions else None
 
 def display_question(question: dict, question_type: str, key_prefix: str):
@@ -298,8 +383,8 @@ def display_question(question: dict, question_type: str, key_prefix: str):
 def read_html_file(uploaded_file):
     """Read and parse HTML file content"""
     if uploaded_file is not None:
-        content = uploaded_file.read().decode('utf-8')
-        return parse_notion_html(content)
+        # Hand the raw bytes straight to the parser rather than decoding a copy first
+        return parse_notion_html(uploaded_file.getvalue())
     return None
 
 # Sidebar for page navigation
@@ -309,35 +394,15 @@ page = st.sidebar.radio("Select a Page", ["Home", "Lesson Plan", "Questions"])
 async def regenerate_single_question(question_type, topic_prompt, index):
     """Regenerate a single question"""
     try:
-        prompt_template = f"""
-        Generate 1 {question_type} question about: {topic_prompt}
+        prompt_template = f"{question_request(1, question_type, topic_prompt)}\n\n{FORMAT_RULES}"
         
-        Format requirements:
-        - For Multiple Choice: Include options a), b), c), d). Mark correct answer with *.
-        - For True/False: Clearly state Answer: True/False
-        - For Short Answer: Include a brief acceptable answer
-        - For Open Ended: Include a sample response
-        """
-        
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-        }
-        
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-pro-002",
-            generation_config=generation_config,
-        )
-        
-        response = model.generate_content(prompt_template)
+        model = get_model("gemini-1.5-pro-002")
+        response = model.generate_content(prompt_template, generation_config=output_budget(1))
         new_questions = parse_generated_questions(response.text, question_type)
         
         if new_questions:
             st.session_state.generated_questions[index] = new_questions[0]
-            if index in st.session_state.answered_questions:
-                st.session_state.answered_questions.remove(index)
+            reset_answer(index)
             return True
     except Exception as e:
         st.error(f"Error regenerating question: {e}")
@@ -348,16 +413,37 @@ def clear_questions():
     st.session_state.generated_questions = []
     st.session_state.current_score = 0
     st.session_state.total_questions = 0
-    st.session_state.answered_questions = set()
+    st.session_state.answered_mask = 0
+    st.session_state.correct_mask = 0
+    st.session_state.submitted_answers = {}
     st.session_state.question_prompt = ""
 
+def reset_answer(index: int):
+    """Mark a replaced question as unanswered, taking back its point if it earned one"""
+    st.session_state.answered_mask &= ~(1 << index)
+    st.session_state.submitted_answers.pop(index, None)
+    # Wrong answers and revealed sample answers never scored, so only correct ones count
+    if (st.session_state.correct_mask >> index) & 1:
+        st.session_state.correct_mask &= ~(1 << index)
+        st.session_state.current_score = max(0, st.session_state.current_score - 1)
+
+# Patterns for splitting and reading generated questions
+_QUESTION_SPLIT_RE = re.compile(r'\n\d+\.|Question \d+:')
+_OPTION_RE = re.compile(r'^\s*[a-dA-D]\)\s*(.*)$')
+# The answer may be written as a sentence, e.g. "Answer: The statement is false"
+_TF_ANSWER_RE = re.compile(r'(?:Answer|Correct):\s*[^\n]*?\b(true|false)\b', re.IGNORECASE)
+
 def parse_generated_questions(text, question_type):
     """Parse the AI generated text into structured question data"""
     questions = []
     
+    if not text or not text.strip():
+        return questions
+    
+    # Split into individual questions
+    question_blocks = _QUESTION_SPLIT_RE.split(text)
+    
     if question_type == "Multiple Choice":
-        # Split into individual questions
-        question_blocks = re.split(r'\n\d+\.|Question \d+:', text)
         for block in question_blocks:
             if not block.strip():
                 continue
@@ -369,11 +455,14 @@ def parse_generated_questions(text, question_type):
             correct_answer = None
             
             for line in lines[1:]:
-                if line.strip().startswith(('a)', 'b)', 'c)', 'd)', 'A)', 'B)', 'C)', 'D)')):
-                    option = line.strip()[2:].strip()
-                    if '*' in option or 'correct' in option.lower():
-                        correct_answer = option.replace('*', '').replace('(correct)', '').strip()
-                    options.append(option.replace('*', '').replace('(correct)', '').strip())
+                match = _OPTION_RE.match(line)
+                if match:
+                    option = match.group(1)
+                    is_correct = '*' in option or 'correct' in option.lower()
+                    option = option.replace('*', '').replace('(correct)', '').strip()
+                    if is_correct:
+                        correct_answer = option
+                    options.append(option)
             
             if question and options and correct_answer:
                 questions.append({
@@ -384,19 +473,14 @@ def parse_generated_questions(text, question_type):
                 })
     
     elif question_type == "True/False":
-        # Split into individual questions
-        question_blocks = re.split(r'\n\d+\.|Question \d+:', text)
         for block in question_blocks:
             if not block.strip():
                 continue
             
             lines = block.strip().split('\n')
             question = lines[0].strip()
-            correct_answer = None
-            
-            for line in lines:
-                if 'Answer:' in line or 'Correct:' in line:
-                    correct_answer = 'True' if 'true' in line.lower() else 'False'
+            match = _TF_ANSWER_RE.search(block)
+            correct_answer = match.group(1).capitalize() if match else None
             
             if question and correct_answer:
                 questions.append({
@@ -406,7 +490,6 @@ def parse_generated_questions(text, question_type):
                 })
     
     elif question_type in ["Short Answer", "Open Ended"]:
-        question_blocks = re.split(r'\n\d+\.|Question \d+:', text)
         for block in question_blocks:
             if not block.strip():
                 continue
@@ -434,9 +517,85 @@ def check_answer(question, user_answer):
         # For short answer and open-ended, we'll use manual checking
         return None
 
+@st.fragment
+def _render_question(i: int, question_type: str, topic_prompt: str, model_option: str):
+    """Render one interactive question on the Questions page"""
+    question = st.session_state.generated_questions[i]
+    answered = bool((st.session_state.answered_mask >> i) & 1)
+    
+    with st.expander(f"Question {i + 1}", expanded=True):
+        col1, col2 = st.columns([10, 1])
+        with col1:
+            st.write(question['question'])
+        with col2:
+            if st.button("🔄", key=f"refresh_{i}", help="Regenerate this question"):
+                try:
+                    # Prepare the prompt for single question regeneration
+                    prompt_template = lesson_plan_prompt(
+                        lesson_plan, 1, question_type, topic_prompt
+                    )
+                    
+                    # Generate new question
+                    model = get_model(model_option)
+                    response = model.generate_content(prompt_template, generation_config=output_budget(1))
+                    new_questions = parse_generated_questions(response.text, question_type)
+                    
+                    if new_questions:
+                        # Replace the specific question
+                        st.session_state.generated_questions[i] = new_questions[0]
+                        reset_answer(i)
+                        st.rerun()
+                except Exception as e:
+                    st.error(f"Error regenerating question: {e}")
+        
+        # Different input types based on question type
+        if question['type'] in ('multiple_choice', 'true_false'):
+            choices = question['options'] if question['type'] == 'multiple_choice' else ["True", "False"]
+            # The radio's state is dropped when it isn't rendered (e.g. on another
+            # page), so a locked-in answer is restored from the stored submission
+            submitted = st.session_state.submitted_answers.get(i)
+            user_answer = st.radio(
+                "Select your answer:",
+                choices,
+                index=choices.index(submitted) if submitted in choices else 0,
+                key=f"q_{i}",
+                disabled=answered
+            )
+            
+            if st.button("Submit", key=f"submit_{i}", disabled=answered):
+                st.session_state.submitted_answers[i] = user_answer
+                if check_answer(question, user_answer):
+                    st.session_state.current_score += 1
+                    st.session_state.correct_mask |= 1 << i
+                st.session_state.answered_mask |= 1 << i
+                # Rerun the whole page so the score metric picks up the answer
+                st.rerun()
+            
+            # Feedback is derived from the stored submission, so it survives reruns
+            if answered and submitted is not None:
+                if check_answer(question, submitted):
+                    st.success("Correct!")
+                else:
+                    st.error(f"Incorrect. The correct answer is: {question['correct_answer']}")
+        
+        else:  # Short Answer and Open Ended
+            st.text_area(
+                "Your answer:",
+                key=f"q_{i}",
+                disabled=answered
+            )
+            
+            if st.button("Show Sample Answer", key=f"show_{i}"):
+                st.info(f"Sample Answer:\n{question['sample_answer']}")
+                st.session_state.answered_mask |= 1 << i
+
+@st.cache_data(show_spinner=False)
+def load_lesson_plan(path='lesson_plan_1.txt'):
+    """Read the lesson plan text once instead of on every rerun"""
+    return Path(path).read_text()
+
 # Load lesson plan content
-with open('lesson_plan_1.txt', 'r') as file:
-    lesson_plan = file.read()
+lesson_plan = load_lesson_plan()
 
 # Page: Home
 if page == "Home":
@@ -536,44 +695,25 @@ elif page == "Questions":
     if st.sidebar.button("Generate Questions 🎯"):
         if topic_prompt:
             try:
-                # Prepare the prompt based on question type and include lesson plan
-                prompt_template = f"""
-                System Instructions: You are a teaching assistant creating educational questions. Here is the lesson plan content to base your questions on:
-
-                {lesson_plan}
-
-                Please generate {num_questions} {question_type} questions about: {topic_prompt}
-                
-                Format requirements:
-                - For Multiple Choice: Number each question and include options a), b), c), d). Mark correct answer with *.
-                - For True/False: Number each question and clearly state Answer: True/False
-                - For Short Answer: Number each question and include a brief acceptable answer
-                - For Open Ended: Number each question and include a sample response
-                
-                Make questions clear and educational, using specific content from the lesson plan.
-                """
-                
-                # Configure Gemini
-                generation_config = {
-                    "temperature": 0.7,
-                    "top_p": 0.95,
-                    "top_k": 40,
-                    "max_output_tokens": 8192,
-                }
-                
-                model = genai.GenerativeModel(
-                    model_name=model_option,
-                    generation_config=generation_config,
+                # Prepare the prompt with the lesson plan as a shared, cacheable prefix
+                prompt_template = lesson_plan_prompt(
+                    lesson_plan, num_questions, question_type, topic_prompt
                 )
                 
-                # Generate response
-                response = model.generate_content(prompt_template)
+                # Generate response, reusing it if the same request was made before
+                response_text = _cached_generate(
+                    model_option,
+                    generation_config_for(num_questions),
+                    prompt_template
+                )
                 
                 # Parse and store questions
-                st.session_state.generated_questions = parse_generated_questions(response.text, question_type)
+                st.session_state.generated_questions = parse_generated_questions(response_text, question_type)
                 st.session_state.current_score = 0
                 st.session_state.total_questions = len(st.session_state.generated_questions)
-                st.session_state.answered_questions = set()
+                st.session_state.answered_mask = 0
+                st.session_state.correct_mask = 0
+                st.session_state.submitted_answers = {}
                 
             except Exception as e:
                 st.error(f"An error occurred: {e}")
@@ -585,6 +725,36 @@ elif page == "Questions":
         clear_questions()
         st.sidebar.success("Questions cleared!")
     
+    # Regenerate several questions with a single request instead of one call each
+    if st.session_state.generated_questions:
+        regen_indices = st.sidebar.multiselect(
+            "Questions to regenerate:",
+            list(range(len(st.session_state.generated_questions))),
+            format_func=lambda i: f"Question {i + 1}"
+        )
+        if st.sidebar.button("Regenerate Selected 🔄", disabled=not regen_indices):
+            try:
+                prompt_template = lesson_plan_prompt(
+                    lesson_plan, len(regen_indices), question_type, topic_prompt
+                )
+                model = get_model(model_option)
+                response = model.generate_content(
+                    prompt_template,
+                    generation_config=output_budget(len(regen_indices))
+                )
+                new_questions = parse_generated_questions(response.text, question_type)
+                
+                # Replace the selected questions in order with the new batch
+                for i, new_question in zip(regen_indices, new_questions):
+                    st.session_state.generated_questions[i] = new_question
+                    reset_answer(i)
+                if len(new_questions) < len(regen_indices):
+                    st.sidebar.warning(
+                        f"Only {len(new_questions)} of {len(regen_indices)} questions were regenerated."
+                    )
+            except Exception as e:
+                st.error(f"Error regenerating questions: {e}")
+    
     # Display interactive questions
     if st.session_state.generated_questions:
         st.markdown("### Interactive Questions")
@@ -594,95 +764,9 @@ elif page == "Questions":
         with score_col1:
             st.metric("Current Score", f"{st.session_state.current_score}/{st.session_state.total_questions}")
         
-        # Display questions
-        for i, question in enumerate(st.session_state.generated_questions):
-            with st.expander(f"Question {i + 1}", expanded=True):
-                col1, col2 = st.columns([10, 1])
-                with col1:
-                    st.write(question['question'])
-                with col2:
-                    if st.button("🔄", key=f"refresh_{i}", help="Regenerate this question"):
-                        try:
-                            # Prepare the prompt for single question regeneration
-                            prompt_template = f"""
-                            System Instructions: You are a teaching assistant creating an educational question. Here is the lesson plan content to base your question on:
-
-                            {lesson_plan}
-
-                            Please generate 1 {question_type} question about: {topic_prompt}
-                            
-                            Format requirements:
-                            - For Multiple Choice: Include options a), b), c), d). Mark correct answer with *.
-                            - For True/False: Clearly state Answer: True/False
-                            - For Short Answer: Include a brief acceptable answer
-                            - For Open Ended: Include a sample response
-                            
-                            Make the question clear and educational, using specific content from the lesson plan.
-                            """
-                            
-                            # Generate new question
-                            response = model.generate_content(prompt_template)
-                            new_questions = parse_generated_questions(response.text, question_type)
-                            
-                            if new_questions:
-                                # Replace the specific question
-                                st.session_state.generated_questions[i] = new_questions[0]
-                                # Remove from answered questions if it was answered
-                                if i in st.session_state.answered_questions:
-                                    st.session_state.answered_questions.remove(i)
-                                    # Adjust score if necessary
-                                    st.session_state.current_score = max(0, st.session_state.current_score - 1)
-                                st.rerun()
-                        except Exception as e:
-                            st.error(f"Error regenerating question: {e}")
-                
-                # Different input types based on question type
-                if question['type'] == 'multiple_choice':
-                    user_answer = st.radio(
-                        "Select your answer:",
-                        question['options'],
-                        key=f"q_{i}",
-                        disabled=i in st.session_state.answered_questions
-                    )
-                    
-                    if st.button("Submit", key=f"submit_{i}", disabled=i in st.session_state.answered_questions):
-                        is_correct = check_answer(question, user_answer)
-                        if is_correct:
-                            st.success("Correct!")
-                            if i not in st.session_state.answered_questions:
-                                st.session_state.current_score += 1
-                        else:
-                            st.error(f"Incorrect. The correct answer is: {question['correct_answer']}")
-                        st.session_state.answered_questions.add(i)
-                
-                elif question['type'] == 'true_false':
-                    user_answer = st.radio(
-                        "Select your answer:",
-                        ["True", "False"],
-                        key=f"q_{i}",
-                        disabled=i in st.session_state.answered_questions
-                    )
-                    
-                    if st.button("Submit", key=f"submit_{i}", disabled=i in st.session_state.answered_questions):
-                        is_correct = check_answer(question, user_answer)
-                        if is_correct:
-                            st.success("Correct!")
-                            if i not in st.session_state.answered_questions:
-                                st.session_state.current_score += 1
-                        else:
-                            st.error(f"Incorrect. The correct answer is: {question['correct_answer']}")
-                        st.session_state.answered_questions.add(i)
-                
-                else:  # Short Answer and Open Ended
-                    user_answer = st.text_area(
-                        "Your answer:",
-                        key=f"q_{i}",
-                        disabled=i in st.session_state.answered_questions
-                    )
-                    
-                    if st.button("Show Sample Answer", key=f"show_{i}"):
-                        st.info(f"Sample Answer:\n{question['sample_answer']}")
-                        st.session_state.answered_questions.add(i)
+        # Display questions; widget changes inside one only rerun that question
+        for i in range(len(st.session_state.generated_questions)):
+            _render_question(i, question_type, topic_prompt, model_option)
         
         # Download button for questions
         if st.button("Download Questions (and Answers Soon 🚧)"):
@@ -693,17 +777,3 @@ elif page == "Questions":
                 file_name="questions.json",
                 mime="application/json"
             )
-
-# Add appropriate styling
-st.markdown("""
-    <style>
-    .stButton>button {
-        width: 100%;
-    }
-    .stMetric {
-        background-color: #f0f2f6;
-        padding: 10px;
-        border-radius: 5px;
-    }
-    </style>
-    """, unsafe_allow_html=True)